@@ -8,10 +8,90 @@ Requires: sudo python storage_receiver.py [options]
 """
 
 import argparse
+import ctypes
+import socket
+import struct
 import time
-from scapy.all import sniff, IP, conf
+import numpy as np
+from numba import njit
 
-conf.verb = 0
+ETH_P_IP = 0x0800
+SO_ATTACH_FILTER = 26
+
+IP_HEADER_LEN = 20
+RCVBUF_BYTES = 1 << 22  # absorb bursts (kernel caps at net.core.rmem_max)
+
+# Link-layer header length by ARPHRD type (lo carries a zeroed Ethernet header)
+LINK_HEADER_LEN = {
+    1: 14,    # ARPHRD_ETHER
+    772: 14,  # ARPHRD_LOOPBACK
+}
+
+_IP_ID = struct.Struct("!H")
+
+# Printable ASCII lookup, indexed by byte value
+_PRINTABLE = np.array([32 <= i <= 126 for i in range(256)], dtype=np.bool_)
+
+
+def make_decoder(bytes_per_packet):
+    """
+    Generate a JIT-compiled decoder specialized for a fixed packet width.
+    
+    The returned decode(value, out, cursor) appends the printable bytes of
+    value to out, high byte first, stopping at a null (padding) byte, and
+    returns the new cursor. The per-byte steps are unrolled in the
+    generated source, so no loop or shift amount is computed at runtime.
+    """
+    lines = ["def decode(value, out, cursor):"]
+    for i in range(bytes_per_packet - 1, -1, -1):
+        lines += [
+            f"    byte_val = (value >> {i * 8}) & 0xFF",
+            f"    if byte_val == 0:",
+            f"        return cursor",
+            f"    if printable[byte_val]:",
+            f"        out[cursor] = byte_val",
+            f"        cursor += 1",
+        ]
+    lines.append("    return cursor")
+    
+    namespace = {'printable': _PRINTABLE}
+    exec(compile('\n'.join(lines), f"<decoder_{bytes_per_packet}>", 'exec'), namespace)
+    return njit(namespace['decode'])
+
+
+def _ip_to_int(ip):
+    """Convert dotted-quad IP to 32-bit integer for BPF comparisons"""
+    return struct.unpack("!I", socket.inet_aton(ip))[0]
+
+
+def build_bpf_filter(link_len, source_ip, dest_ip, ttl):
+    """
+    Compile "ip[8] == TTL and ip src X and ip dst Y" to classic BPF.
+    
+    Equivalent to the optimized output of `tcpdump -dd` for the same
+    expression, with offsets shifted by the link-layer header length.
+    TTL is checked first since it rejects nearly all system traffic.
+    Accepted packets are truncated to the link and IP headers (snaplen),
+    since nothing past IP_ID is read.
+    """
+    return [
+        (0x30, 0, 0, link_len + 8),            # ldb [ttl]
+        (0x15, 0, 5, ttl),                     # jeq #ttl, else drop
+        (0x20, 0, 0, link_len + 12),           # ld  [src]
+        (0x15, 0, 3, _ip_to_int(source_ip)),   # jeq #src, else drop
+        (0x20, 0, 0, link_len + 16),           # ld  [dst]
+        (0x15, 0, 1, _ip_to_int(dest_ip)),     # jeq #dst, else drop
+        (0x06, 0, 0, link_len + IP_HEADER_LEN),  # ret #snaplen (headers only)
+        (0x06, 0, 0, 0),                       # ret #0 (drop)
+    ]
+
+
+def attach_filter(sock, insns):
+    """Attach a classic BPF program to a socket (SO_ATTACH_FILTER)"""
+    prog = b''.join(struct.pack('HBBI', *insn) for insn in insns)
+    buf = ctypes.create_string_buffer(prog, len(prog))
+    fprog = struct.pack('HL', len(insns), ctypes.addressof(buf))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
 
 
 class StorageChannelReceiver:
@@ -22,29 +102,20 @@ class StorageChannelReceiver:
         self.dest_ip = dest_ip
         self.expected_ttl = ttl
         self.debug = debug
-        self.decoded_bytes = []
+        self.out = np.empty(1 << 16, dtype=np.uint8)
+        self.cursor = 0
         self.start_time = None
         self.bytes_per_packet = 2  # IP_ID is 16 bits
         self.eof_threshold = 0xFFFF
         self.packet_count = 0
         self.last_packet_id = None
-        self.system_packets_filtered = 0
-    
-    def packet_callback(self, pkt):
-        """Process incoming packet and extract covert data"""
-        
-        if IP not in pkt:
-            return
         
-        encoded_value = pkt[IP].id
-        ttl = pkt[IP].ttl
-        
-        # Filter by TTL to eliminate system packets
-        if ttl != self.expected_ttl:
-            self.system_packets_filtered += 1
-            if self.debug:
-                print(f"[TTL] skip 0x{encoded_value:04x} (TTL {ttl} != {self.expected_ttl})")
-            return
+        # Compile the decoder now rather than on the first packet
+        self._decode = make_decoder(self.bytes_per_packet)
+        self._decode(0, self.out, 0)
+    
+    def packet_callback(self, encoded_value):
+        """Process IP_ID of an incoming packet and extract covert data"""
         
         # Skip duplicate packets (loopback quirk)
         if encoded_value == self.last_packet_id:
@@ -64,54 +135,72 @@ class StorageChannelReceiver:
             print("\nEOF detected - transmission complete")
             return
         
-        # Decode bytes
-        byte_list = []
-        
         if self.debug:
             print(f"\n[Pkt {self.packet_count + 1}] 0x{encoded_value:04x}")
-        
-        for i in range(self.bytes_per_packet - 1, -1, -1):
-            byte_val = (encoded_value >> (i * 8)) & 0xFF
             
-            if self.debug:
-                char = chr(byte_val) if 32 <= byte_val <= 126 else f"0x{byte_val:02x}"
+            # IP_ID holds two bytes, high byte first
+            for i, byte_val in ((1, encoded_value >> 8), (0, encoded_value & 0xFF)):
+                char = chr(byte_val) if _PRINTABLE[byte_val] else f"0x{byte_val:02x}"
                 print(f"  byte {i}: 0x{byte_val:02x} ({byte_val:3d}) '{char}'", end="")
-            
-            if byte_val == 0:
-                if self.debug:
+                
+                if byte_val == 0:
                     print(" [null]")
-                break
-            
-            if 32 <= byte_val <= 126:
-                byte_list.append(chr(byte_val))
-                if self.debug:
-                    print(" [ok]")
-            else:
-                if self.debug:
-                    print(" [skip]")
-        
-        self.decoded_bytes.extend(byte_list)
+                    break
+                print(" [ok]" if _PRINTABLE[byte_val] else " [skip]")
+        
+        # Grow output buffer before the compiled decoder writes past its end
+        if self.cursor + self.bytes_per_packet > len(self.out):
+            self.out = np.resize(self.out, 2 * len(self.out))
+        
+        start = self.cursor
+        self.cursor = self._decode(encoded_value, self.out, self.cursor)
         self.packet_count += 1
         
-        current_msg = ''.join(self.decoded_bytes)
-        print(f"Pkt {self.packet_count}: {len(self.decoded_bytes)} chars: '{current_msg}'")
+        # Per-packet output only in debug mode; otherwise periodic progress
+        if self.debug:
+            new_chars = self.out[start:self.cursor].tobytes().decode('ascii')
+            print(f"Pkt {self.packet_count}: +{self.cursor - start} chars '{new_chars}' (total {self.cursor})")
+        elif self.packet_count % 16 == 0:
+            print(f"Received {self.packet_count} packets ({self.cursor} chars)...")
+    
+    def open_socket(self, iface="lo"):
+        """Open raw packet socket with kernel-side src/dst/TTL filter attached"""
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, 0)
+        
+        # Bind with protocol 0 (no traffic) to learn the link type,
+        # then attach the filter before any packet can be queued
+        sock.bind((iface, 0))
+        hatype = sock.getsockname()[3]
+        link_len = LINK_HEADER_LEN.get(hatype, 0)
+        
+        attach_filter(sock, build_bpf_filter(link_len, self.source_ip, self.dest_ip,
+                                             self.expected_ttl))
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF_BYTES)
+        sock.bind((iface, ETH_P_IP))
+        
+        return sock, link_len
     
     def run(self):
-        """Start sniffing for packets"""
+        """Start capturing packets"""
         print(f"Receiver (debug={self.debug})")
         print(f"Source: {self.source_ip}")
         print(f"Dest: {self.dest_ip}")
         print(f"TTL: {self.expected_ttl}")
         print(f"Waiting...\n")
         
+        sock = None
         try:
-            filter_str = f"ip src {self.source_ip} and ip dst {self.dest_ip}"
-            sniff(
-                prn=self.packet_callback,
-                filter=filter_str,
-                store=False,
-                iface="lo"
-            )
+            sock, link_len = self.open_socket()
+            id_offset = link_len + 4
+            
+            # Read each frame into one reusable buffer and pull IP_ID
+            # straight from its fixed offset in the IPv4 header
+            buf = bytearray(64)
+            unpack_id = _IP_ID.unpack_from
+            
+            while True:
+                sock.recv_into(buf)
+                self.packet_callback(unpack_id(buf, id_offset)[0])
         except KeyboardInterrupt:
             print("\n\nInterrupted")
             self.print_results()
@@ -121,10 +210,13 @@ class StorageChannelReceiver:
         except Exception as e:
             print(f"\nError: {e}")
             self.print_results()
+        finally:
+            if sock is not None:
+                sock.close()
     
     def print_results(self):
         """Print decoded message and statistics"""
-        message = ''.join(self.decoded_bytes)
+        message = self.out[:self.cursor].tobytes().decode('ascii', 'replace')
         
         print(f"\n{'='*60}")
         print(f"Results")
@@ -135,13 +227,12 @@ class StorageChannelReceiver:
             return
         
         elapsed = time.time() - self.start_time
-        bits_decoded = len(self.decoded_bytes) * 8
+        bits_decoded = self.cursor * 8
         bps = bits_decoded / elapsed if elapsed > 0 else 0
         
         print(f"\nMessage: \"{message}\"")
-        print(f"Length: {len(self.decoded_bytes)} chars")
+        print(f"Length: {self.cursor} chars")
         print(f"Packets: {self.packet_count}")
-        print(f"Filtered: {self.system_packets_filtered} system packets")
         print(f"Time: {elapsed:.3f}s")
         print(f"Rate: {bps:.1f} bits/sec")
         
@@ -8,21 +8,49 @@ Requires: sudo python storage_sender.py [options]
 """
 
 import argparse
+import socket
+import struct
 import time
-from scapy.all import IP, send, conf
+from scapy.all import Ether, IP, sendpfast, conf
 
 conf.verb = 0
 
+_U16 = struct.Struct("!H")
 
-def send_storage_channel(target_ip, message, ttl=42, verbose=True):
+
+def patch_ip_id(header, ident):
+    """
+    Rewrite IP_ID of a serialized IPv4 header in place.
+    
+    The header checksum is updated incrementally (RFC 1624,
+    HC' = ~(~HC + ~m + m')) instead of being recomputed.
+    """
+    old_id = _U16.unpack_from(header, 4)[0]
+    csum = _U16.unpack_from(header, 10)[0]
+    
+    total = (~csum & 0xFFFF) + (~old_id & 0xFFFF) + ident
+    total = (total & 0xFFFF) + (total >> 16)
+    total = (total & 0xFFFF) + (total >> 16)
+    
+    _U16.pack_into(header, 4, ident)
+    _U16.pack_into(header, 10, ~total & 0xFFFF)
+
+
+def send_storage_channel(target_ip, message, ttl=42, verbose=True, fast=False, mbps=None):
     """
     Send message by encoding into IP_ID field.
     
+    One IP header is serialized up front and patched in place with each
+    packet's IP_ID and checksum, then sent over a single raw socket
+    (IP_HDRINCL). In fast mode all packets are handed to tcpreplay.
+    
     Args:
         target_ip: Destination IP address
         message: Message to transmit
         ttl: TTL value to use (default: 42)
         verbose: Print status output
+        fast: Blast all packets via scapy.sendpfast (requires tcpreplay)
+        mbps: Rate limit for fast mode (default: top speed)
     """
     
     bytes_per_packet = 2  # IP_ID is 16 bits
@@ -34,44 +62,71 @@ def send_storage_channel(target_ip, message, ttl=42, verbose=True):
         packets_needed = (len(message) + bytes_per_packet - 1) // bytes_per_packet
         print(f"Packets: {packets_needed}\n")
     
+    # Encode message into 16-bit values in one pass (null-padded)
+    payload = message.encode('latin-1')
+    payload += b'\x00' * (-len(payload) % bytes_per_packet)
+    encoded_values = struct.unpack(f"!{len(payload) // bytes_per_packet}H", payload)
+    
+    if verbose:
+        for i, encoded_value in enumerate(encoded_values):
+            chunk = payload[i * bytes_per_packet:(i + 1) * bytes_per_packet]
+            chunk_display = chunk.rstrip(b'\x00').decode('latin-1') if any(chunk) else "(pad)"
+            print(f"Pkt {i + 1}: '{chunk_display}' → 0x{encoded_value:04x}")
+    
+    # Serialize the header once; it is patched in place for every packet
+    header = bytearray(bytes(IP(dst=target_ip, id=0, ttl=ttl)))
+    
+    patch_ip_id(header, 0xFFFF)
+    raw_eof = bytes(header)
+    
     start_time = time.time()
     packets_sent = 0
     
-    # Encode message into packets
-    for i in range(0, len(message), bytes_per_packet):
-        chunk = message[i:i+bytes_per_packet]
-        chunk = chunk.ljust(bytes_per_packet, '\x00')
-        
-        # Convert bytes to 16-bit integer
-        encoded_value = 0
-        for char in chunk:
-            encoded_value = (encoded_value << 8) | ord(char)
+    if fast:
+        iface = conf.route.route(target_ip)[0]
         
-        pkt = IP(dst=target_ip, id=encoded_value, ttl=ttl)
+        frames = []
+        for encoded_value in encoded_values:
+            patch_ip_id(header, encoded_value)
+            frames.append(Ether() / IP(bytes(header)))
+        frames += [Ether() / IP(raw_eof)] * 3
         
         if verbose:
-            chunk_display = chunk.rstrip('\x00') if chunk != '\x00' * bytes_per_packet else "(pad)"
-            print(f"Pkt {packets_sent + 1}: '{chunk_display}' → 0x{encoded_value:04x}")
+            print(f"\nBlasting {len(frames)} frames on {iface} via tcpreplay...")
         
         try:
-            send(pkt, verbose=0)
-            packets_sent += 1
-            time.sleep(0.05)
+            sendpfast(frames, mbps=mbps, iface=iface)
+            packets_sent = len(encoded_values)
         except Exception as e:
-            print(f"Error sending packet: {e}")
+            print(f"Error sending packets: {e}")
             return
-    
-    # Send EOF markers
-    if verbose:
-        print("\nSending EOF markers...")
-    
-    for _ in range(3):
-        eof_pkt = IP(dst=target_ip, id=0xFFFF, ttl=ttl)
-        try:
-            send(eof_pkt, verbose=0)
-            time.sleep(0.05)
-        except:
-            pass
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_RAW)
+        addr = (target_ip, 0)
+        
+        for encoded_value in encoded_values:
+            patch_ip_id(header, encoded_value)
+            try:
+                sock.sendto(header, addr)
+                packets_sent += 1
+                time.sleep(0.05)
+            except OSError as e:
+                print(f"Error sending packet: {e}")
+                sock.close()
+                return
+        
+        # Send EOF markers
+        if verbose:
+            print("\nSending EOF markers...")
+        
+        for _ in range(3):
+            try:
+                sock.sendto(raw_eof, addr)
+                time.sleep(0.05)
+            except OSError:
+                pass
+        
+        sock.close()
     
     elapsed = time.time() - start_time
     bps = (len(message) * 8) / elapsed if elapsed > 0 else 0
@@ -89,6 +144,7 @@ Examples:
   sudo python storage_sender.py --target 127.0.0.1
   sudo python storage_sender.py --target 127.0.0.1 --ttl 99
   sudo python storage_sender.py --target 192.168.1.5 --message "Secret"
+  sudo python storage_sender.py --target 127.0.0.1 --fast --mbps 10
         """
     )
     
@@ -96,10 +152,15 @@ Examples:
     parser.add_argument('--message', default="Help! I need somebody. Help! Not just anybody.",
                        help='Message to transmit')
     parser.add_argument('--ttl', type=int, default=42, help='TTL value (default: 42)')
+    parser.add_argument('--fast', action='store_true',
+                       help='Send all packets at once via tcpreplay (scapy sendpfast)')
+    parser.add_argument('--mbps', type=float, default=None,
+                       help='Rate limit for --fast mode (default: top speed)')
     
     args = parser.parse_args()
     
-    send_storage_channel(args.target, args.message, args.ttl)
+    send_storage_channel(args.target, args.message, args.ttl,
+                        fast=args.fast, mbps=args.mbps)
 
 
 if __name__ == '__main__':
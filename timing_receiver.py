@@ -8,38 +8,93 @@ Logs received IATs for SNR analysis and statistical evaluation.
 """
 
 import socket
+import struct
+import ctypes
 import time
 import argparse
-import math
+import numpy as np
+from bitarray import bitarray
+
+SO_ATTACH_FILTER = 26
+SO_TIMESTAMPNS = 35
+SCM_TIMESTAMPNS = SO_TIMESTAMPNS
+
+_TIMESPEC = struct.Struct("@qq")
+_TIMESPEC_CMSG_SPACE = socket.CMSG_SPACE(_TIMESPEC.size)
+
+
+def build_bpf_filter():
+    """
+    Classic BPF accepting only channel datagrams: b'X' or b'EOF'.
+    
+    On a UDP socket the filter sees the packet from the UDP header on,
+    so len is 8 + payload length and the payload starts at offset 8.
+    """
+    return [
+        (0x80, 0, 0, 0),           # ld  len
+        (0x15, 0, 2, 9),           # jeq #9, else try 11
+        (0x30, 0, 0, 8),           # ldb [8]
+        (0x15, 5, 6, ord('X')),    # jeq #'X', accept, else drop
+        (0x15, 0, 5, 11),          # jeq #11, else drop
+        (0x28, 0, 0, 8),           # ldh [8]
+        (0x15, 0, 3, 0x454F),      # jeq #'EO', else drop
+        (0x30, 0, 0, 10),          # ldb [10]
+        (0x15, 0, 1, ord('F')),    # jeq #'F', else drop
+        (0x06, 0, 0, 0x40000),     # ret #snaplen
+        (0x06, 0, 0, 0),           # ret #0 (drop)
+    ]
+
+
+def attach_filter(sock, insns):
+    """Attach a classic BPF program to a socket (SO_ATTACH_FILTER)"""
+    prog = b''.join(struct.pack('HBBI', *insn) for insn in insns)
+    buf = ctypes.create_string_buffer(prog, len(prog))
+    fprog = struct.pack('HL', len(insns), ctypes.addressof(buf))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+
+
+def recv_timestamped(sock):
+    """
+    Receive one datagram with its kernel arrival time in ns.
+    
+    Uses the SCM_TIMESTAMPNS control message (requires SO_TIMESTAMPNS),
+    so the timestamp excludes userspace scheduling delay. Falls back to
+    time.time_ns() if the kernel did not attach one.
+    """
+    data, ancdata, _, _ = sock.recvmsg(16, _TIMESPEC_CMSG_SPACE)
+    for level, cmsg_type, cmsg_data in ancdata:
+        if level == socket.SOL_SOCKET and cmsg_type == SCM_TIMESTAMPNS:
+            sec, nsec = _TIMESPEC.unpack(cmsg_data)
+            return data, sec * 1_000_000_000 + nsec
+    return data, time.time_ns()
 
 
 def receive_timing_channel(listen_port, threshold=0.15, log_file=None):
     """Receive and decode timing channel, optionally logging IATs"""
     
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    
+    # Drop stray datagrams in the kernel so they never get timestamped
+    attach_filter(sock, build_bpf_filter())
+    sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
     sock.bind(('0.0.0.0', listen_port))
     
     print(f"Listening on port {listen_port}")
     print(f"Threshold: {threshold}s")
     print(f"Waiting for packets...\n")
     
-    bits = []
-    iats = []
-    bit_labels = []
+    # IATs in a float64 array grown by doubling; bits packed MSB first
+    iats_buf = np.empty(1 << 16, dtype=np.float64)
+    bits = bitarray(endian='big')
+    n = 0
     
-    prev_time = None
+    prev_ns = None
     start_time = None
     eof_count = 0
     packets_received = 0
     
-    log = None
-    if log_file:
-        log = open(log_file, 'w')
-        log.write("bit_idx,bit,iat\n")
-    
     while True:
-        data, addr = sock.recvfrom(1024)
-        current_time = time.time()
+        data, current_ns = recv_timestamped(sock)
         packets_received += 1
         
         # EOF check
@@ -51,55 +106,50 @@ def receive_timing_channel(listen_port, threshold=0.15, log_file=None):
         
         # First packet starts the clock
         if start_time is None:
-            start_time = current_time
-            prev_time = current_time
+            start_time = current_ns / 1e9
+            prev_ns = current_ns
             continue
         
         # Calculate IAT
-        iat = current_time - prev_time
-        iats.append(iat)
+        iat = (current_ns - prev_ns) / 1e9
+        if n == len(iats_buf):
+            iats_buf = np.resize(iats_buf, 2 * n)
         
         # Decode bit
-        bit = '1' if iat > threshold else '0'
-        bits.append(bit)
-        bit_labels.append(bit)
-        
-        # Log to file
-        if log:
-            log.write(f"{len(bits)-1},{bit},{iat}\n")
+        iats_buf[n] = iat
+        bits.append(iat > threshold)
+        n += 1
         
-        prev_time = current_time
+        prev_ns = current_ns
         
-        if len(bits) % 80 == 0:
-            print(f"Decoded {len(bits)} bits...")
+        if n % 80 == 0:
+            print(f"Decoded {n} bits...")
     
-    # Convert bits to text
-    bits_str = ''.join(bits)
-    chars = [bits_str[i:i+8] for i in range(0, len(bits_str), 8)]
-    message = ''.join(chr(int(c, 2)) for c in chars if len(c) == 8)
+    iats = iats_buf[:n]
+    
+    # Convert bits to text (trailing partial byte dropped)
+    message = bits[:n - n % 8].tobytes().decode('latin-1')
     
     elapsed = time.time() - start_time
-    bps = len(bits) / elapsed if elapsed > 0 else 0
+    bps = n / elapsed if elapsed > 0 else 0
     
     # Compute statistics 
-    iats_0 = [iats[i] for i in range(len(iats)) if bit_labels[i] == '0']
-    iats_1 = [iats[i] for i in range(len(iats)) if bit_labels[i] == '1']
-    
-    mean_0 = sum(iats_0) / len(iats_0) if iats_0 else 0
-    mean_1 = sum(iats_1) / len(iats_1) if iats_1 else 0
+    is_one = np.frombuffer(bits.unpack(), dtype=np.bool_)
+    iats_0 = iats[~is_one]
+    iats_1 = iats[is_one]
     
-    var_0 = sum((x - mean_0) ** 2 for x in iats_0) / len(iats_0) if iats_0 else 0
-    var_1 = sum((x - mean_1) ** 2 for x in iats_1) / len(iats_1) if iats_1 else 0
+    mean_0 = iats_0.mean() if iats_0.size else 0
+    mean_1 = iats_1.mean() if iats_1.size else 0
     
-    std_0 = math.sqrt(var_0)
-    std_1 = math.sqrt(var_1)
+    std_0 = iats_0.std() if iats_0.size else 0
+    std_1 = iats_1.std() if iats_1.size else 0
     
     
     print(f"\n{'='*60}")
     print(f"Reception complete")
     print(f"{'='*60}")
     print(f"\nMessage: \"{message}\"")
-    print(f"Bits: {len(bits)}")
+    print(f"Bits: {n}")
     print(f"Packets: {packets_received}")
     print(f"Time: {elapsed:.2f}s")
     print(f"Rate: {bps:.1f} bits/sec")
@@ -110,8 +160,10 @@ def receive_timing_channel(listen_port, threshold=0.15, log_file=None):
     
     print(f"{'='*60}\n")
     
-    if log:
-        log.close()
+    # Log to file in one batch, after the timing-critical loop
+    if log_file:
+        np.savetxt(log_file, np.c_[np.arange(n), is_one, iats], delimiter=',',
+                   fmt=('%d', '%d', '%.9f'), header='bit_idx,bit,iat', comments='')
         print(f"IATs logged to: {log_file}")
     
     sock.close()
@@ -11,11 +11,27 @@ Optionally logs the sent IATs for analysis.
 import socket
 import time
 import argparse
+import csv
+
+SPIN_NS = 200_000  # busy-wait window before each deadline
+
+
+def sleep_until(deadline_ns):
+    """Sleep until a time.monotonic_ns() deadline, spinning for the last SPIN_NS"""
+    remaining = deadline_ns - time.monotonic_ns()
+    if remaining > SPIN_NS:
+        time.sleep((remaining - SPIN_NS) / 1e9)
+    while time.monotonic_ns() < deadline_ns:
+        pass
+
+
+# 8-char bit string for every byte value
+_BYTE_BITS = [format(i, '08b') for i in range(256)]
 
 
 def text_to_bits(text):
     """Convert ASCII text to binary string"""
-    return ''.join(format(ord(c), '08b') for c in text)
+    return ''.join(map(_BYTE_BITS.__getitem__, text.encode('latin-1')))
 
 
 def send_timing_channel(target_ip, target_port, message, bit0_delay, bit1_delay, log_file=None):
@@ -30,45 +46,52 @@ def send_timing_channel(target_ip, target_port, message, bit0_delay, bit1_delay,
     print(f"Delays: bit0={bit0_delay}s, bit1={bit1_delay}s")
     print(f"Gap: {abs(bit1_delay - bit0_delay) * 1000:.1f}ms")
     
-    log = None
+    # Log rows are kept in memory and written after transmission
+    log_rows = [] if log_file else None
     if log_file:
-        log = open(log_file, 'w')
-        log.write("bit_idx,bit,iat\n")
         print(f"Logging to: {log_file}")
     
     print(f"\nTransmitting {len(bits)} bits...\n")
     
+    addr = (target_ip, target_port)
     start_time = time.time()
     
+    # Absolute deadlines keep sleep overshoot from accumulating across bits
+    deadline = time.monotonic_ns()
+    
     for i, bit in enumerate(bits):
-        sock.sendto(b'X', (target_ip, target_port))
+        sock.sendto(b'X', addr)
         
         if bit == '0':
             delay = bit0_delay
         else:
             delay = bit1_delay
         
-        if log:
-            log.write(f"{i},{bit},{delay}\n")
-        
-        time.sleep(delay)
+        if log_rows is not None:
+            log_rows.append((i, bit, delay))
         
         if (i + 1) % 80 == 0:
             print(f"Sent {i+1}/{len(bits)} bits")
+        
+        deadline += round(delay * 1e9)
+        sleep_until(deadline)
     
-    # EOF markers
+    # EOF markers, sent back-to-back (receiver stops at the second)
     print("Sending EOF markers...")
     for _ in range(3):
-        sock.sendto(b'EOF', (target_ip, target_port))
-        time.sleep(0.5)
+        sock.sendto(b'EOF', addr)
     
     elapsed = time.time() - start_time
     bps = len(bits) / elapsed if elapsed > 0 else 0
     
     print(f"\nDone: {len(bits)} bits in {elapsed:.2f}s ({bps:.1f} bits/sec)")
     
-    if log:
-        log.close()
+    if log_rows is not None:
+        with open(log_file, 'w', newline='') as log:
+            writer = csv.writer(log)
+            writer.writerow(("bit_idx", "bit", "iat"))
+            writer.writerows(log_rows)
+    
     sock.close()
 
 